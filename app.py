@@ -1,18 +1,20 @@
+import math
 import os
-import uuid
+import queue
+import secrets
 import shutil
+import numpy as np
 from flask import Flask, render_template, request, jsonify, abort
-from flask_cors import CORS
-from dotenv import load_dotenv
+import config
+from utils import _kernels
 from utils.audio_utils import AudioUtils
-from utils.model_utils import ModelManager
-from utils.task_manager import TaskManager
+from utils.model_utils import get_model_manager
+from utils.task_manager import get_task_manager
 import threading
+from concurrent.futures import ThreadPoolExecutor
 
-# 加载配置
-load_dotenv()
+# 环境变量在 config 导入时统一加载
 app = Flask(__name__)
-CORS(app)
 
 # 配置
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
@@ -23,19 +25,65 @@ app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 524288000
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # 初始化管理器
-model_manager = ModelManager()
-task_manager = TaskManager()
+model_manager = get_model_manager()
+task_manager = get_task_manager()
 
-# 添加锁以防止并行处理
-import threading
-process_lock = threading.Lock()
+# 单槽位执行器：转写任务复用同一工作线程，Future 自动捕获任务异常
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='asr')
+
+def _log_task_result(future):
+    """输出后台转写任务抛出的异常，避免静默丢失"""
+    exc = future.exception()
+    if exc is not None:
+        print(f"转写任务异常: {exc}")
+
+# 导入时预计算扩展名集合，避免在请求热路径上做对象构造
+_ALLOWED_EXT = frozenset(e.lstrip('.') for e in config.ALLOWED_VIDEO_EXTENSIONS)
+
+def allowed_file(filename: str) -> bool:
+    """检查文件扩展名是否为支持的视频格式（不区分大小写）"""
+    i = filename.rfind('.')
+    return i != -1 and filename[i + 1:].lower() in _ALLOWED_EXT
+
+# 兜底开关：打开后清理时仍会全量扫描上传目录（用于清理历史残留文件）
+CLEANUP_FULL_SWEEP = os.getenv('CLEANUP_FULL_SWEEP', 'false').lower() == 'true'
+
+def _sweep_upload_folder():
+    """全量清理上传目录，仅作为兜底路径使用
+
+    整目录删除后重建：一次 rmtree 代替逐条列举+逐文件 unlink，
+    免去每个条目的路径解析和类型判断。
+    """
+    upload_dir = app.config['UPLOAD_FOLDER']
+    try:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        os.makedirs(upload_dir, exist_ok=True)
+        print(f"已全量清理目录: {upload_dir}")
+    except OSError as e:
+        print(f"清理uploads目录时出错: {e}")
 
-# 在启动服务器时就加载模型
-print("服务启动时加载模型...")
-try:
-    model_manager.download_and_load_model()
-except Exception as e:
-    print(f"模型加载失败，将在首次使用时尝试加载: {e}")
+def initialize_model():
+    """在启动服务器前加载模型，失败时推迟到首次使用
+
+    放在函数里而不是模块导入时执行，测试导入 app 不会触发
+    ModelScope 下载。
+    """
+    print("服务启动时加载模型...")
+    try:
+        model_manager.download_and_load_model()
+    except Exception as e:
+        print(f"模型加载失败，将在首次使用时尝试加载: {e}")
+        return
+
+    # 用一个全零分片预热：一次性的计算图构建和内核编译在启动时
+    # 完成，而不是落在用户上传后的第一个分片上
+    try:
+        _kernels.warmup()
+        warmup = np.zeros(config.CHUNK_DURATION * config.SAMPLE_RATE, dtype=np.float32)
+        model_manager.transcribe_batch([warmup])
+        print("模型预热完成")
+    except Exception as e:
+        print(f"模型预热失败: {e}")
 
 @app.route('/')
 def index():
@@ -65,8 +113,7 @@ def upload_video():
         return jsonify({'error': 'No selected file'}), 400
 
     # 检查文件类型（不区分大小写）
-    filename_lower = file.filename.lower()
-    if not filename_lower.endswith(('.mp4', '.mov', '.avi', '.mkv', '.webm', '.flv')):
+    if not allowed_file(file.filename):
         return jsonify({'error': 'Unsupported file format'}), 400
 
     # 检查文件大小
@@ -81,36 +128,34 @@ def upload_video():
         }), 413
 
     # 彻底清理之前的所有任务数据
-    print("收到新的视频上传请求，开始彻底清理所有缓存数据")
+    print("收到新的视频上传请求，开始清理上一个任务的缓存数据")
 
-    # 先清理uploads目录中所有临时文件
-    try:
-        upload_dir = app.config['UPLOAD_FOLDER']
-        for entry in os.listdir(upload_dir):
-            entry_path = os.path.join(upload_dir, entry)
-            if os.path.isfile(entry_path):
-                os.remove(entry_path)
-            elif os.path.isdir(entry_path):
-                shutil.rmtree(entry_path)
-        print(f"已清理目录: {upload_dir}")
-    except Exception as e:
-        print(f"清理uploads目录时出错: {e}")
+    # 请求取消旧任务并等待其真正结束再清理，任务一结束 Event 即被
+    # 置位，不用等待操作系统回收工作线程
+    if task_manager.is_processing:
+        task_manager.request_cancel()
+    if not task_manager.wait_done(timeout=10.0):
+        print("等待上一个任务结束超时，继续清理")
 
-    # 然后清理任务管理器状态
+    # 清理任务管理器状态和其登记的临时文件，避免全目录扫描
     task_manager.clear()
-
-    # 保存文件
-    task_id = str(uuid.uuid4())
+    if CLEANUP_FULL_SWEEP:
+        _sweep_upload_folder()
+
+    # 保存文件：用 4MB 缓冲区拷贝上传流，相比 Werkzeug file.save
+    # 默认的 16KB 缓冲，读写系统调用次数减少约 256 倍
+    # 16 位十六进制随机串足够区分任务，比构造再字符串化一个
+    # UUID 对象便宜得多
+    task_id = secrets.token_hex(8)
     filename = f"{task_id}_{file.filename}"
     video_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(video_path)
+    with open(video_path, 'wb') as out:
+        shutil.copyfileobj(file.stream, out, length=4 * 1024 * 1024)
 
-    # 启动转写任务（使用锁防止并行处理）
-    threading.Thread(
-        target=_process_video_safe,
-        args=(video_path, task_id),
-        daemon=True
-    ).start()
+    # 提交转写任务到单槽位执行器
+    future = executor.submit(_process_video_safe, video_path, task_id)
+    future.add_done_callback(_log_task_result)
+    task_manager.current_future = future
 
     return jsonify({
         'message': 'File uploaded and processing started',
@@ -118,57 +163,116 @@ def upload_video():
     })
 
 def _process_video_safe(video_path: str, task_id: str):
-    """安全处理视频转写的后台任务，使用锁防止并行处理"""
-    with process_lock:
-        # 首先检查是否存在正在处理的任务
-        if hasattr(task_manager, 'is_processing') and task_manager.is_processing:
-            print("已有任务在处理中，新任务将替代旧任务")
-            task_manager.clear()
+    """后台转写入口：抢占处理槽位，必要时取消并等待上一个任务
+
+    不再持有全局锁等待整个转写结束，槽位通过 try_claim 的
+    比较并置位完成交接。
+    """
+    if not task_manager.try_claim():
+        print("已有任务在处理中，请求取消旧任务")
+        task_manager.request_cancel()
+        task_manager.wait_done(10.0)
+        if not task_manager.try_claim():
+            print("旧任务未能及时退出，放弃本次转写")
+            return
 
-        try:
-            # 设置处理中标记
-            task_manager.is_processing = True
-            _process_video(video_path, task_id)
-        finally:
-            # 清除处理中标记
-            task_manager.is_processing = False
+    try:
+        _process_video(video_path, task_id)
+    finally:
+        task_manager.release()
 
 def _process_video(video_path: str, task_id: str):
-    """处理视频转写的后台任务"""
-    # 提取音频
-    audio_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{task_id}.wav")
-    # 分片处理
-    segments_dir = os.path.join(app.config['UPLOAD_FOLDER'], task_id)
-
-    # 初始化新任务，保存文件路径以用于后续清理
-    task_manager.start_new_task(task_id, video_path, audio_path, segments_dir)
+    """处理视频转写的后台任务：流式解码 + 分批转写"""
+    # 音频直接从 ffmpeg 管道流式读取，不再产生中间 WAV 和分片文件
+    task_manager.start_new_task(task_id, video_path)
 
     # 如果模型未加载，尝试加载
     if not model_manager.model:
         model_manager.download_and_load_model()
 
-    # 提取音频
-    AudioUtils.extract_audio(video_path, audio_path)
-    segments = AudioUtils.split_audio(audio_path, segments_dir)
+    # 预先获取时长用于预分配转写结果存储
+    duration = AudioUtils.get_audio_duration(video_path)
+    total_segments = math.ceil(duration / config.CHUNK_DURATION)
+    task_manager.set_total_segments(total_segments)
+    print(f"视频时长 {duration:.1f} 秒，预计 {total_segments} 个分片")
 
-    print(f"音频分片完成，共 {len(segments)} 个片段，每个大约 10 秒")
+    # 生产者线程负责解码音频，与模型推理重叠执行：
+    # 推理第 N 批时，第 N+1 批的音频已经在后台解码。
+    # 队列容量略大于批大小的一半，解码可以持续领先推理
+    audio_queue = queue.Queue(maxsize=4)
 
-    # 转录每个分片
-    for i, segment_path in enumerate(segments):
-        print(f"正在转写分片 {i}")
-        transcript = model_manager.transcribe_audio(segment_path)
-        print(f"分片 {i} 转写完成，结果长度: {len(transcript)}")
-        task_manager.save_transcript(i, transcript)
-        print(f"已保存分片 {i} 的转写结果")
+    # 生产者线程里的解码异常带回消费者侧，让任务整体失败
+    producer_error = []
 
-    print(f"总共有 {len(task_manager.transcripts)} 个分片的转写结果")
+    def _produce_audio():
+        try:
+            chunks = AudioUtils.stream_audio_chunks(
+                video_path, cancel_wait=task_manager.wait_cancel)
+            for item in chunks:
+                if task_manager.is_cancelled():
+                    break
+                audio_queue.put(item)
+        except Exception as e:
+            producer_error.append(e)
+        finally:
+            audio_queue.put(None)  # 结束标记
+
+    threading.Thread(target=_produce_audio, daemon=True).start()
+
+    # 消费者：累积一个批次后一次性转写
+    batch_indices, batch_audio, batch_release = [], [], []
+
+    def _flush_batch():
+        if not batch_audio:
+            return
+        print(f"正在转写分片 {batch_indices[0]} 至 {batch_indices[-1]}")
+        texts = model_manager.transcribe_batch(batch_audio)
+        for i, transcript in zip(batch_indices, texts):
+            task_manager.save_transcript(i, transcript)
+            print(f"已保存分片 {i} 的转写结果，结果长度: {len(transcript)}")
+        # 转写完成后把分片缓冲区归还解码端复用
+        for chunk, release in zip(batch_audio, batch_release):
+            release(chunk)
+        batch_indices.clear()
+        batch_audio.clear()
+        batch_release.clear()
+
+    while True:
+        item = audio_queue.get()
+        if item is None:
+            _flush_batch()
+            break
+        if task_manager.is_cancelled():
+            print("任务已被取消，停止转写")
+            # 排空队列，让生产者尽快退出
+            while item is not None:
+                item = audio_queue.get()
+            break
+        batch_indices.append(item[0])
+        batch_audio.append(item[1])
+        batch_release.append(item[2])
+        if len(batch_audio) >= config.TRANSCRIBE_BATCH_SIZE:
+            _flush_batch()
+
+    if task_manager.is_cancelled():
+        return
+
+    # 解码失败时不能标记完成，否则用户会拿到一份"已完成"的空转写
+    if producer_error:
+        raise producer_error[0]
+
+    print(f"总共有 {task_manager.completed_segments} 个分片的转写结果")
     task_manager.mark_processing_complete()
     print("转写全部完成")
 
 @app.route('/api/transcript')
 def get_transcript():
-    transcripts = task_manager.get_transcript()
-    print(f"API 请求: 共 {len(transcripts)} 个分片结果")
+    # 客户端通过 since 携带已有的最大分片编号，只下发增量
+    since = request.args.get('since', -1, type=int)
+    transcripts = task_manager.get_transcript(since=since)
+    # 每次轮询都会命中这里，日志及其字符串格式化只在调试模式下产生
+    if config.FLASK_DEBUG:
+        print(f"API 请求: 返回 {len(transcripts)} 个分片结果 (since={since})")
     return jsonify(transcripts)
 
 @app.route('/api/transcript/<int:segment_id>')
@@ -180,26 +284,13 @@ def get_segment_transcript(segment_id):
 
 @app.route('/api/clear', methods=['POST'])
 def clear_task():
-    print("收到清理请求，开始彻底清理所有任务数据和缓存")
+    print("收到清理请求，开始清理任务数据和缓存")
 
-    # 清理任务数据
+    # 清理任务数据及其登记的临时文件
     task_manager.clear()
-
-    # 清理uploads目录中所有临时文件
-    try:
-        upload_dir = app.config['UPLOAD_FOLDER']
-        if os.path.exists(upload_dir):
-            for filename in os.listdir(upload_dir):
-                file_path = os.path.join(upload_dir, filename)
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-                    print(f"已删除临时文件: {file_path}")
-                elif os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
-                    print(f"已删除临时目录: {file_path}")
-        print("所有缓存数据已清理完毕")
-    except Exception as e:
-        print(f"清理缓存时出错: {e}")
+    if CLEANUP_FULL_SWEEP:
+        _sweep_upload_folder()
+    print("缓存数据已清理完毕")
 
     return jsonify({'message': 'Task cleared and all cache removed'})
 
@@ -207,30 +298,52 @@ def clear_task():
 def clear_cache():
     """清理uploads目录中除当前视频之外的其他缓存文件"""
     print("收到清理其他缓存的请求")
-    try:
-        if task_manager.current_task_id and task_manager.video_path:
-            upload_dir = app.config['UPLOAD_FOLDER']
-            current_filename = os.path.basename(task_manager.video_path)
-            for entry in os.listdir(upload_dir):
-                entry_path = os.path.join(upload_dir, entry)
-                if entry != current_filename and entry != task_manager.current_task_id:
-                    if os.path.isfile(entry_path):
-                        os.remove(entry_path)
-                        print(f"已清理缓存文件: {entry_path}")
-                    elif os.path.isdir(entry_path):
-                        shutil.rmtree(entry_path)
-                        print(f"已清理缓存目录: {entry_path}")
-            print("已清理其他缓存数据")
-    except Exception as e:
-        print(f"清理缓存时出错: {e}")
+    if task_manager.current_task_id and task_manager.video_path:
+        upload_dir = app.config['UPLOAD_FOLDER']
+        current_filename = os.path.basename(task_manager.video_path)
+        # scandir 的 DirEntry 自带目录项里的类型信息，
+        # is_file/is_dir 不再对每个条目各做一次 stat。
+        # 异常处理下沉到单个条目：一个文件被占用不中断整个扫描
+        with os.scandir(upload_dir) as it:
+            for entry in it:
+                if entry.name == current_filename or entry.name == task_manager.current_task_id:
+                    continue
+                try:
+                    if entry.is_file(follow_symlinks=False):
+                        os.remove(entry.path)
+                        print(f"已清理缓存文件: {entry.path}")
+                    elif entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path)
+                        print(f"已清理缓存目录: {entry.path}")
+                except OSError as e:
+                    print(f"清理 {entry.path} 时出错: {e}")
+        print("已清理其他缓存数据")
     return jsonify({'message': 'Cache cleared'})
 
 @app.route('/api/status')
 def get_status():
-    return jsonify({
-        'processing_complete': task_manager.is_processing_complete(),
-        'segments': len(task_manager.get_transcript())
+    # 一次读取原子发布的进度快照，三个字段保证来自同一时刻
+    segments, _total, processing_complete = task_manager.get_progress()
+
+    # 状态没有变化时返回 304，轮询方退化为一次 ETag 比对，
+    # 完全跳过 JSON 序列化
+    etag = f'"{task_manager.current_task_id}-{segments}-{processing_complete}"'
+    if request.if_none_match.contains_raw(etag):
+        return '', 304
+
+    resp = jsonify({
+        'processing_complete': processing_complete,
+        'segments': segments
     })
+    resp.headers['ETag'] = etag
+    return resp
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    initialize_model()
+    if config.FLASK_DEBUG:
+        app.run(debug=True)
+    else:
+        # 多线程 WSGI 服务器：进度轮询、上传和静态文件互不阻塞，
+        # 模型在启动时已加载，所有工作线程共享同一实例
+        from waitress import serve
+        serve(app, host='0.0.0.0', port=5000, threads=8)
\ No newline at end of file
@@ -0,0 +1,29 @@
+# 集中存放应用配置常量
+import os
+
+from dotenv import load_dotenv
+
+# 环境变量只在这里加载一次，其余模块直接 import config
+load_dotenv()
+
+# 调试模式下使用 Flask 自带的开发服务器
+FLASK_DEBUG = os.getenv('FLASK_DEBUG', 'false').lower() == 'true'
+
+# 支持的视频文件扩展名（不区分大小写）
+ALLOWED_VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.webm', '.flv')
+
+# 模型输入采样率（Hz）。重采样统一在 ffmpeg 提取阶段完成，
+# Python 侧的转写路径不做任何重采样
+SAMPLE_RATE = 16000
+
+# 音频分片时长（秒）。所有分片都会补零到这一固定长度，
+# 让 MLX 每次推理看到相同形状并复用已编译的计算图
+CHUNK_DURATION = 10
+
+# 可选的权重量化位宽（0 表示保持模型自带的 8bit 精度）。
+# 设为 4 时在加载后做 groupwise int4 量化，权重带宽约减半
+QUANTIZE_BITS = int(os.getenv('QUANTIZE_BITS', '0'))
+
+# 每次模型调用处理的分片数：批内分片共享一次图启动开销，
+# 吞吐随批大小近似线性提升，直到受内存带宽限制
+TRANSCRIBE_BATCH_SIZE = int(os.getenv('TRANSCRIBE_BATCH_SIZE', '8'))
@@ -6,6 +6,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const transcriptContainer = document.getElementById('transcriptContainer');
 
     let transcripts = {};
+    let maxSegmentId = -1; // 已收到的最大分片编号，轮询时只请求增量
     let isFirstTranscriptReceived = false;
     let updateInterval = null; // 用于定期更新转录结果
     let videoLoaded = false; // 视频是否已加载
@@ -39,6 +40,7 @@ document.addEventListener('DOMContentLoaded', () => {
             isFirstTranscriptReceived = false;
             videoLoaded = false;
             transcripts = {};
+            maxSegmentId = -1;
             transcriptContainer.innerHTML = '正在处理视频...';
 
             // 立即禁用播放按钮
@@ -180,30 +182,29 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     async function checkTranscriptProgress() {
-        const response = await fetch('/api/transcript');
+        // 只请求比本地已有分片更新的增量结果
+        const response = await fetch(`/api/transcript?since=${maxSegmentId}`);
         const result = await response.json();
         const resultCount = Object.keys(result).length;
-        const currentCount = Object.keys(transcripts).length;
 
-        console.log('从后端收到的转写结果:', result);
-        console.log('转写片段数量:', resultCount);
+        console.log('从后端收到的增量转写结果:', result);
+        console.log('新增片段数量:', resultCount);
 
-        // 只有当收到的结果比当前多时才更新
-        if (resultCount > currentCount) {
-            // 将字符串键转换为整数，确保正确的映射
-            const formattedTranscripts = {};
+        if (resultCount > 0) {
+            // 将字符串键转换为整数后合并进本地缓存
             for (const key in result) {
                 if (result.hasOwnProperty(key)) {
                     const segmentId = parseInt(key);
                     if (!isNaN(segmentId)) {
-                        formattedTranscripts[segmentId] = result[key];
+                        transcripts[segmentId] = result[key];
+                        if (segmentId > maxSegmentId) {
+                            maxSegmentId = segmentId;
+                        }
                     }
                     console.log(`处理片段 ${key} (${segmentId}): ${result[key]}`);
                 }
             }
-            transcripts = formattedTranscripts;
             isFirstTranscriptReceived = true;
-            console.log('格式化后的转写结果:', transcripts);
             console.log('已准备好的片段:', Object.keys(transcripts));
 
             // 如果视频已经加载，启用播放按钮
@@ -245,6 +246,7 @@ document.addEventListener('DOMContentLoaded', () => {
         await fetch('/api/clear', { method: 'POST' });
         isFirstTranscriptReceived = false;
         transcripts = {};
+        maxSegmentId = -1;
         transcriptContainer.innerHTML = '';
         videoLoaded = false;
         stopUpdatingTranscripts(); // 停止检查
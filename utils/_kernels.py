@@ -0,0 +1,33 @@
+# 数值热路径的小内核：numba 可用时 JIT 为并行 SIMD 代码，
+# 否则退化为等价的单遍 numpy 实现
+import numpy as np
+
+try:
+    from numba import njit, prange
+    _HAS_NUMBA = True
+except ImportError:
+    _HAS_NUMBA = False
+
+
+if _HAS_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _i16_to_f32_jit(src, dst):
+        for i in prange(src.size):
+            dst[i] = src[i] * np.float32(1.0 / 32768.0)
+
+
+def i16_to_f32(src: np.ndarray, dst: np.ndarray = None) -> np.ndarray:
+    """int16 PCM 转归一化 float32，读写各一遍，不产生中间数组"""
+    if dst is None:
+        dst = np.empty(src.size, dtype=np.float32)
+    if _HAS_NUMBA:
+        _i16_to_f32_jit(src, dst)
+    else:
+        np.multiply(src, np.float32(1.0 / 32768.0), out=dst, casting='unsafe')
+    return dst
+
+
+def warmup() -> None:
+    """预热 numba JIT：启动时触发一次编译，首个真实分片不再付编译成本"""
+    if _HAS_NUMBA:
+        i16_to_f32(np.zeros(16, dtype=np.int16))
@@ -1,44 +1,189 @@
+import functools
+import os
+import queue
 import subprocess
+import threading
 import wave
-import math
-import os
-from pathlib import Path
+
+import numpy as np
+
+import config
+from utils._kernels import i16_to_f32
+
+
+def _ffmpeg_preexec():
+    """在 ffmpeg 子进程中提升调度优先级，权限不足时静默忽略
+
+    解码是转写流水线的上游，优先级略高可以避免它被调度到
+    低优先级核上拖慢整条流水线。
+    """
+    try:
+        os.nice(-5)
+    except OSError:
+        pass
+
+
+@functools.lru_cache(maxsize=1)
+def _soxr_available() -> bool:
+    """检查本机 ffmpeg 是否编译了 libsoxr，进程内只探测一次
+
+    未编译 libsoxr 的构建遇到 resampler=soxr 会直接以
+    "Unknown resampler" 退出，必须先探测再决定是否启用。
+    """
+    try:
+        result = subprocess.run(['ffmpeg', '-version'],
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return '--enable-libsoxr' in result.stdout
+
+
+@functools.lru_cache(maxsize=128)
+def _probe_duration(video_path: str, mtime_ns: int, size: int) -> float:
+    """实际执行 ffprobe；mtime/size 参与缓存键，文件变化即失效"""
+    command = [
+        'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1', video_path
+    ]
+    result = subprocess.run(command, check=True, capture_output=True, text=True)
+    return float(result.stdout.strip())
 
 
 class AudioUtils:
     @staticmethod
-    def extract_audio(video_path: str, audio_path: str) -> None:
-        """从视频中提取音频为 PCM 格式"""
+    def get_audio_duration(video_path: str) -> float:
+        """获取媒体时长（秒）
+
+        结果按 (路径, mtime, 大小) 缓存，同一文件重复查询只付出
+        一次 stat，而不是每次 fork+exec 一个 ffprobe 进程。
+        """
+        st = os.stat(video_path)
+        return _probe_duration(video_path, st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def stream_audio_chunks(video_path: str, chunk_duration: int = config.CHUNK_DURATION,
+                            cancel_wait=None):
+        """流式解码视频音频，按固定时长产出 float32 分片
+
+        ffmpeg 直接向管道输出原始 f32le 单声道采样，全程不写中间
+        WAV、不解析文件头、不做 Python 侧格式转换；末尾分片补零到
+        固定长度。逐个产出 (分片编号, float32 数组, release 回调)，
+        消费方用完数组后调用 release 把缓冲区归还池里复用。
+
+        读取线程始终做阻塞读，不在每个分片上轮询；cancel_wait 为
+        带超时的取消等待（如 TaskManager.wait_cancel），守护线程
+        阻塞在其上，取消一发生就终止 ffmpeg，管道关闭让阻塞中的
+        读立即返回。
+        """
+        chunk_samples = config.SAMPLE_RATE * chunk_duration
+        chunk_bytes = chunk_samples * 4
+
+        # 预分配的分片缓冲池：池空时退化为普通分配，不会阻塞解码
+        pool: queue.Queue = queue.Queue()
+        for _ in range(8):
+            pool.put(np.empty(chunk_samples, dtype=np.float32))
+
+        def release(buf: np.ndarray) -> None:
+            pool.put(buf)
         command = [
-            'ffmpeg', '-i', video_path, '-vn', '-acodec', 'pcm_s16le', '-ac', '1',
-            '-ar', '16000', audio_path, '-y'
+            # 关闭输入缓冲并启用低延迟解码，首个分片更快到达管道
+            'ffmpeg', '-fflags', '+nobuffer', '-flags', 'low_delay',
+            '-i', video_path, '-vn',
+            '-f', 'f32le', '-ac', '1', '-ar', str(config.SAMPLE_RATE),
+        ]
+        if _soxr_available():
+            # 用 libsoxr 做重采样（C + SIMD），质量和速度都优于默认的
+            # swresample；未编译 libsoxr 的构建回退到默认重采样器
+            command += ['-af', 'aresample=resampler=soxr']
+        command += [
+            # 限制解码线程数，避免 ffmpeg 与 MLX 推理争抢性能核
+            '-threads', '2',
+            '-loglevel', 'error', 'pipe:1'
         ]
-        subprocess.run(command, check=True, capture_output=True)
+        process = subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            preexec_fn=_ffmpeg_preexec
+        )
+
+        # 后台汇集 stderr，既不丢错误输出，也不会因管道写满阻塞 ffmpeg
+        stderr_chunks: list = []
+
+        def _drain_stderr():
+            stderr_chunks.append(process.stderr.read())
+        stderr_thread = threading.Thread(target=_drain_stderr, daemon=True)
+        stderr_thread.start()
+
+        stop_watch = threading.Event()
+        # 记录 ffmpeg 是被取消终止的，区别于自身解码失败
+        cancel_fired = threading.Event()
+        if cancel_wait is not None:
+            def _watch_cancel():
+                # 阻塞等取消信号，即时唤醒；短超时只为检测流结束
+                while not stop_watch.is_set():
+                    if cancel_wait(0.1):
+                        cancel_fired.set()
+                        process.terminate()
+                        return
+            threading.Thread(target=_watch_cancel, daemon=True).start()
+
+        try:
+            index = 0
+            while True:
+                # 直接读入池里的缓冲区，不经过中间 bytes 对象
+                try:
+                    chunk = pool.get_nowait()
+                except queue.Empty:
+                    chunk = np.empty(chunk_samples, dtype=np.float32)
+                view = memoryview(chunk).cast('B')
+                filled = 0
+                while filled < chunk_bytes:
+                    n = process.stdout.readinto(view[filled:])
+                    if not n:
+                        break
+                    filled += n
+                if filled == 0:
+                    break
+                if filled < chunk_bytes:
+                    # 末尾分片：把未填充部分（含可能的残缺采样）置零
+                    chunk[filled // 4:] = 0.0
+                yield index, chunk, release
+                index += 1
+                if filled < chunk_bytes:
+                    break
+            # 流读尽后检查退出码：损坏的文件、无音频流或 ffmpeg
+            # 配置问题必须让任务失败，而不是以空转写"完成"
+            returncode = process.wait()
+            stderr_thread.join(timeout=1.0)
+            if returncode != 0 and not cancel_fired.is_set():
+                err = b''.join(stderr_chunks).decode('utf-8', 'replace').strip()
+                raise RuntimeError(
+                    f"ffmpeg 解码失败（返回码 {returncode}）: {err or '无错误输出'}")
+        finally:
+            stop_watch.set()
+            # 消费方提前放弃生成器时同样走到这里，终止 ffmpeg
+            # 以免其阻塞在已写满的管道上
+            if process.poll() is None:
+                process.terminate()
+            process.stdout.close()
+            process.wait()
+            stderr_thread.join(timeout=1.0)
+            process.stderr.close()
 
     @staticmethod
-    def split_audio(audio_path: str, output_dir: str, segment_duration: int = 10) -> list[str]:
-        """按指定时长拆分音频文件"""
-        os.makedirs(output_dir, exist_ok=True)
+    def load_audio(audio_path: str) -> np.ndarray:
+        """读取 16-bit PCM WAV 为归一化的 float32 数组
 
+        转换和归一化融合为一次乘法，只分配一个连续的输出数组，
+        后续环节可以直接使用而无需再做 dtype 转换或拷贝。
+        """
         with wave.open(audio_path, 'rb') as wf:
-            sample_rate = wf.getframerate()
-            num_channels = wf.getnchannels()
-            sample_width = wf.getsampwidth()
-            total_frames = wf.getnframes()
-
-            segment_frames = int(sample_rate * segment_duration)
-            num_segments = math.ceil(total_frames / segment_frames)
-
-            segments = []
-            for i in range(num_segments):
-                start_frame = i * segment_frames
-                wf.setpos(start_frame)
-                frames = wf.readframes(segment_frames)
-
-                segment_path = os.path.join(output_dir, f'segment_{i}.wav')
-                with wave.open(segment_path, 'wb') as segment_wf:
-                    segment_wf.setparams((num_channels, sample_width, sample_rate, 0, 'NONE', 'not compressed'))
-                    segment_wf.writeframes(frames)
-                segments.append(segment_path)
-
-        return segments
\ No newline at end of file
+            if wf.getframerate() != config.SAMPLE_RATE:
+                # 重采样一律由 ffmpeg/libsoxr 在提取阶段完成，
+                # Python 侧不保留任何重采样路径
+                raise ValueError(
+                    f"音频采样率 {wf.getframerate()} 与模型要求的 "
+                    f"{config.SAMPLE_RATE} 不一致，请先经 ffmpeg -ar 重采样"
+                )
+            frames = wf.readframes(wf.getnframes())
+        samples = np.frombuffer(frames, dtype=np.int16)
+        return i16_to_f32(samples)
\ No newline at end of file
@@ -1,35 +1,71 @@
+import functools
+import json
 import os
 import shutil
+import numpy as np
+
+import config
+import mlx.core as mx
+import mlx.nn as nn
 from modelscope import snapshot_download
-from dotenv import load_dotenv
 from mlx_audio.stt.models.funasr import Model
 
 
 class ModelManager:
     def __init__(self):
-        load_dotenv()
         self.model_dir = os.getenv('MODEL_DIR', 'models')
         os.makedirs(self.model_dir, exist_ok=True)
         self.model = None
         self.model_name = 'mlx-community/Fun-ASR-MLT-Nano-2512-8bit'
+        # 批量转写时复用的 [B, T] 输入缓冲区，按需增长
+        self._batch_buffer = None
+
+    def _resolve_model_dir(self) -> str:
+        """解析模型的本地快照目录
+
+        热启动时直接读取 .resolved.json 记录的路径，跳过
+        snapshot_download 对整个缓存目录的遍历和哈希校验；
+        记录缺失或失效时才走一次完整下载/校验并回写记录。
+        """
+        cache_file = os.path.join(self.model_dir, '.resolved.json')
+        try:
+            with open(cache_file) as f:
+                record = json.load(f)
+            path = record.get('path', '')
+            if record.get('model_id') == self.model_name and path and os.path.isdir(path):
+                return path
+        except (OSError, ValueError):
+            pass
+
+        print(f"开始下载模型: {self.model_name}")
+        path = snapshot_download(self.model_name, cache_dir=self.model_dir)
+        try:
+            with open(cache_file, 'w') as f:
+                json.dump({'model_id': self.model_name, 'path': path}, f)
+        except OSError:
+            pass
+        return path
 
     def download_and_load_model(self) -> None:
         """使用 ModelScope 下载模型并加载到内存"""
         if not self.model:
-            print(f"开始下载模型: {self.model_name}")
-
-            # 使用 ModelScope 下载模型
-            model_dir = snapshot_download(
-                self.model_name,
-                cache_dir=self.model_dir
-            )
-            print(f"模型已下载到: {model_dir}")
+            model_dir = self._resolve_model_dir()
+            print(f"模型目录: {model_dir}")
 
             # 加载 MLX 模型
             print("开始加载模型...")
             self.model = Model.from_pretrained(model_dir)
             print("模型加载完成")
 
+            # 可选的 int4 量化：Apple Silicon 上推理以权重读取为主，
+            # 位宽减半大致等比例提升吞吐；失败时回退到原精度
+            if config.QUANTIZE_BITS == 4:
+                try:
+                    nn.quantize(self.model, group_size=64, bits=4)
+                    print("已将模型权重量化为 int4")
+                except Exception as e:
+                    print(f"int4 量化失败，继续使用原精度: {e}")
+
     def transcribe_audio(self, audio_path: str) -> str:
         """对单个音频文件进行转录"""
         if not self.model:
@@ -38,19 +74,72 @@ class ModelManager:
         try:
             # 执行转写
             result = self.model.generate(audio_path)
-
-            # 处理 STTOutput 对象
-            if hasattr(result, 'text'):
-                return result.text
-            # 尝试多种可能的返回格式
-            elif isinstance(result, dict):
-                if 'text' in result:
-                    return result['text']
-                elif 'transcription' in result:
-                    return result['transcription']
-            elif isinstance(result, str):
-                return result
-            return str(result)
+            return self._extract_text(result)
         except Exception as e:
             print(f"转写错误: {e}")
-            return ""
\ No newline at end of file
+            return ""
+
+    def transcribe_batch(self, audio_batch: list) -> list[str]:
+        """批量转录多个音频分片，一次模型调用处理整批数据
+
+        将各分片补零到批内最大长度后堆叠为 [B, T] 数组，只调用一次
+        generate，摊薄每个分片的模型调用开销。
+        """
+        if not self.model:
+            raise ValueError("Model not loaded. Call download_and_load_model() first.")
+        if not audio_batch:
+            return []
+
+        # 音频由生产者统一转换为连续的 float32，此处不再做 dtype 转换；
+        # 非连续数组会迫使下游复制，直接在入口拦下
+        assert all(chunk.dtype == np.float32 and chunk.flags['C_CONTIGUOUS']
+                   for chunk in audio_batch)
+
+        # 固定分片长度：所有分片（包括末尾不足的）都补零到同一形状，
+        # 使 MLX 每次都命中已缓存的计算图而不是按新形状重新构建
+        rows = len(audio_batch)
+        fixed_len = config.CHUNK_DURATION * config.SAMPLE_RATE
+        cols = max(fixed_len, max(chunk.shape[0] for chunk in audio_batch))
+        if (self._batch_buffer is None
+                or self._batch_buffer.shape[0] < rows
+                or self._batch_buffer.shape[1] < cols):
+            self._batch_buffer = np.zeros((rows, cols), dtype=np.float32)
+        batch = self._batch_buffer[:rows, :cols]
+        for i, chunk in enumerate(audio_batch):
+            batch[i, :chunk.shape[0]] = chunk
+            batch[i, chunk.shape[0]:] = 0.0
+
+        try:
+            # 显式构造 mx.array：Apple Silicon 统一内存下经缓冲协议
+            # 零拷贝接入，避免 generate 内部再复制一次输入
+            results = self.model.generate(mx.array(batch))
+            return [self._extract_text(result) for result in results]
+        except Exception as e:
+            print(f"批量转写错误: {e}")
+            return ["" for _ in audio_batch]
+
+    @staticmethod
+    def _extract_text(result) -> str:
+        """从模型返回结果中提取文本"""
+        # 处理 STTOutput 对象
+        if hasattr(result, 'text'):
+            return result.text
+        # 尝试多种可能的返回格式
+        elif isinstance(result, dict):
+            if 'text' in result:
+                return result['text']
+            elif 'transcription' in result:
+                return result['transcription']
+        elif isinstance(result, str):
+            return result
+        return str(result)
+
+
+@functools.cache
+def get_model_manager() -> ModelManager:
+    """返回进程级唯一的 ModelManager 实例
+
+    functools.cache 自带线程安全的单次构造语义，调用方无需再做
+    加锁或判空检查。
+    """
+    return ModelManager()
\ No newline at end of file
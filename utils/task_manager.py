@@ -1,73 +1,210 @@
 import os
 import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Dict, Optional, List
 
+from utils.iouring_fs import batch_unlink
+
+# 清理用单工作线程：文件删除移出请求线程，按提交顺序串行执行
+_cleanup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reset')
+
 
 class TaskManager:
-    """单例任务管理器，确保同时只处理一个任务"""
-    _instance = None
+    """任务管理器，确保同时只处理一个任务
+
+    进程级唯一实例在模块底部构造，通过 get_task_manager() 获取，
+    不再走 __new__ 里的判空/加锁。
 
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance._reset()
-        return cls._instance
+    并发约定：进度类读取（completed_segments、processing_complete
+    等单字段）依赖 GIL 下属性读写的原子性，取消标志走 Event 的
+    原子 set/is_set，均不加锁；
+    _claim_lock 只保护处理槽位的比较并置位，绝不跨越耗时操作持有。
+    UI 轮询因此不会与转写线程产生锁竞争。
+    """
+
+    def __init__(self):
+        self._reset()
+        # 处理槽位状态与同步原语跨任务复用，不随 _reset 重建
+        self.is_processing = False
+        self._claim_lock = threading.Lock()
+        # 任务完成信号：初始为已完成状态
+        self.task_done = threading.Event()
+        self.task_done.set()
+        # 取消标志跨 _reset 存活：clear() 不得抹掉仍在运行的旧任务
+        # 的取消信号，只有新任务通过 try_claim 接管槽位后才复位
+        self._cancelled_evt = threading.Event()
+        # 当前转写任务的 Future 句柄
+        self.current_future = None
+        # 最近一次后台文件清理的 Future，开新任务前可等待其完成
+        self._cleanup_future: Optional[Future] = None
+        # 串行化 clear()：并发调用只有一个真正摘走路径并提交删除
+        self._reset_gate = threading.Lock()
 
     def _reset(self):
         self.current_task_id: Optional[str] = None
-        self.transcripts: Dict[int, str] = {}
+        # 按分片编号索引的转写结果，已知总数后一次性预分配
+        self.transcripts: List[Optional[str]] = []
+        self.completed_segments: int = 0
         self.audio_segments: List[str] = []
         self.processing_complete: bool = False
-        self.is_processing: bool = False
         self.video_path: Optional[str] = None
         self.audio_path: Optional[str] = None
         self.segments_dir: Optional[str] = None
+        # 本次任务创建的所有临时文件/目录，清理时只删除这里登记的路径
+        self.tracked_paths: set = set()
+        # 全量结果字典的缓存及其生成时的完成计数，完成数未变化的
+        # 轮询直接复用缓存，不重建字典
+        self._full_cache: Optional[Dict[str, str]] = None
+        self._full_cache_version: int = -1
+        # 最新进度快照 (已完成数, 总分片数, 是否全部完成)。
+        # 写入方每次整体替换元组，GIL 下属性赋值原子，读取方一次
+        # 取到一致的快照，无需逐字段读取
+        self._progress_snapshot: tuple = (0, 0, False)
+
+    def try_claim(self) -> bool:
+        """尝试占用处理槽位；已有任务在处理时返回 False
+
+        锁只保护这里的比较并置位，不会在整个转写期间持有。
+        """
+        with self._claim_lock:
+            if self.is_processing:
+                return False
+            self.is_processing = True
+            # 槽位确已易主，旧任务必然退出，此时复位取消标志才安全
+            self._cancelled_evt.clear()
+            self.task_done.clear()
+            return True
+
+    def release(self) -> None:
+        """释放处理槽位并通知等待者"""
+        with self._claim_lock:
+            self.is_processing = False
+        self.task_done.set()
+
+    def request_cancel(self) -> None:
+        """请求取消当前任务，由工作线程在分片边界检查"""
+        self._cancelled_evt.set()
+
+    def is_cancelled(self) -> bool:
+        """热路径上的取消检查：单次原子读取，无锁"""
+        return self._cancelled_evt.is_set()
+
+    def wait_cancel(self, timeout: Optional[float] = None) -> bool:
+        """阻塞等待取消信号，取消发生时立即唤醒并返回 True
+
+        给长时间阻塞的操作（如守护 ffmpeg 的监视线程）用，
+        替代 sleep + 轮询，取消延迟从轮询间隔降为即时。
+        """
+        return self._cancelled_evt.wait(timeout)
+
+    def wait_done(self, timeout: Optional[float] = None) -> bool:
+        """等待当前任务结束，返回是否在超时前结束"""
+        return self.task_done.wait(timeout)
 
     def start_new_task(self, task_id: str, video_path: str = None, audio_path: str = None, segments_dir: str = None) -> None:
         """开始新任务，清理之前的任务"""
+        # 确保上一个任务的后台文件清理已经落盘，避免新旧任务的
+        # 磁盘操作交错
+        if self._cleanup_future is not None:
+            try:
+                self._cleanup_future.result(timeout=5.0)
+            except Exception as e:
+                print(f"等待上次清理完成时出错: {e}")
+            self._cleanup_future = None
         self._reset()
         self.current_task_id = task_id
         self.video_path = video_path
         self.audio_path = audio_path
         self.segments_dir = segments_dir
+        for path in (video_path, audio_path, segments_dir):
+            if path:
+                self.tracked_paths.add(path)
+
+    def set_total_segments(self, count: int) -> None:
+        """预分配转写结果存储，避免逐段增长"""
+        self.transcripts = [None] * count
+        self.completed_segments = 0
+        self._progress_snapshot = (0, count, False)
 
     def save_transcript(self, segment_id: int, text: str) -> None:
         """保存分片转录结果"""
+        if segment_id >= len(self.transcripts):
+            self.transcripts.extend([None] * (segment_id + 1 - len(self.transcripts)))
         self.transcripts[segment_id] = text
+        self.completed_segments += 1
+        self._progress_snapshot = (
+            self.completed_segments, len(self.transcripts), self.processing_complete)
+
+    def get_transcript(self, segment_id: Optional[int] = None,
+                       since: int = -1) -> Dict[str, str] | str | None:
+        """获取指定分片或所有转写结果
 
-    def get_transcript(self, segment_id: Optional[int] = None) -> Dict[str, str] | str | None:
-        """获取指定分片或所有转写结果"""
+        since 为客户端已持有的最大分片编号，只返回编号更大的增量，
+        避免长视频轮询时反复重发整个结果集。
+        """
         if segment_id is None:
-            # 转换为字符串键以适应 JSON 序列化
-            str_transcripts = {}
-            for seg_id, text in self.transcripts.items():
-                str_transcripts[str(seg_id)] = text
-            return str_transcripts
-        return self.transcripts.get(segment_id, None)
+            if since >= 0:
+                # 增量请求本身就只涉及少量新分片，直接构建
+                return {str(seg_id): text for seg_id, text in enumerate(self.transcripts)
+                        if text is not None and seg_id > since}
+            # 全量请求按完成计数做缓存：没有新结果时直接复用上次
+            # 构建的字典（转换为字符串键以适应 JSON 序列化）
+            version = self.completed_segments
+            if self._full_cache is None or self._full_cache_version != version:
+                self._full_cache = {
+                    str(seg_id): text for seg_id, text in enumerate(self.transcripts)
+                    if text is not None}
+                self._full_cache_version = version
+            return self._full_cache
+        if 0 <= segment_id < len(self.transcripts):
+            return self.transcripts[segment_id]
+        return None
 
     def is_processing_complete(self) -> bool:
         return self.processing_complete
 
     def mark_processing_complete(self) -> None:
         self.processing_complete = True
+        self._progress_snapshot = (
+            self.completed_segments, len(self.transcripts), True)
+
+    def get_progress(self) -> tuple:
+        """读取进度快照 (已完成数, 总分片数, 是否全部完成)
+
+        只做一次属性读取，不加锁，轮询方任意 QPS 都不会与转写线程
+        产生竞争。
+        """
+        return self._progress_snapshot
 
     def clear(self) -> None:
-        """清理所有任务数据和临时文件"""
+        """清理所有任务数据和临时文件
+
+        内存状态同步重置；tracked_paths 中登记路径的删除提交到后台
+        清理线程，调用方（通常是请求线程）不等待磁盘 I/O。
+        """
+        # 快速路径：从未开始过任务或刚清理过时，状态本就是初始值，
+        # 两次属性读取即可判定，跳过门锁、重置和打印。
+        # 取消标志不在这里复位——超时未退的旧任务可能还在检查它
+        if self.current_task_id is None and not self.tracked_paths:
+            return
+
         print("开始清理任务管理器中的数据")
 
-        # 删除临时文件
-        if self.video_path and os.path.exists(self.video_path):
-            os.remove(self.video_path)
-            print(f"已删除视频文件: {self.video_path}")
-        if self.audio_path and os.path.exists(self.audio_path):
-            os.remove(self.audio_path)
-            print(f"已删除音频文件: {self.audio_path}")
-        if self.segments_dir and os.path.exists(self.segments_dir):
-            import shutil
-            shutil.rmtree(self.segments_dir)
-            print(f"已删除音频分片目录: {self.segments_dir}")
-
-        # 重置状态
-        self._reset()
+        # 单飞：上传和取消同时触发清理时，只有先进门的一方摘走
+        # 路径快照并提交删除，后来者看到空集合直接复用在途 Future
+        with self._reset_gate:
+            paths = self.tracked_paths
+            self._reset()
+            if paths:
+                self._cleanup_future = _cleanup_executor.submit(batch_unlink, paths)
+
+        print("任务管理器已重置")
+
+# 进程级唯一实例，导入时构造一次
+_TASK_MANAGER = TaskManager()
+
 
-        print("任务管理器已重置")
\ No newline at end of file
+def get_task_manager() -> TaskManager:
+    """返回进程级唯一的 TaskManager 实例"""
+    return _TASK_MANAGER